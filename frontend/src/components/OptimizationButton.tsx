@@ -5,6 +5,7 @@ import { RotateCwSquare } from "lucide-react";
 import { OptimizationModal } from "./OptimizationModal";
 import { useOptimizationModal } from "../hooks/useOptimizationModal";
 import { optimizerApi } from "../lib/api";
+import { useAuth } from "@/contexts/AuthContext";
 import { Task } from "../types/task";
 import toast from "react-hot-toast";
 
@@ -21,6 +22,7 @@ export const OptimizationButton = ({
   exitSelectionMode,
   canOptimize,
 }: OptimizationButtonProps) => {
+  const { user } = useAuth();
   const {
     isOpen,
     currentStep,
@@ -42,12 +44,15 @@ export const OptimizationButton = ({
       setError(null);
 
       // 最適化APIを呼び出し
-      const result = await optimizerApi.optimizeTasks({
-        tasks: selectedTasks,
-        weights: params.weights,
-        detailed: params.detailed,
-        maxSolutions: params.maxSolutions,
-      });
+      const result = await optimizerApi.optimizeTasks(
+        {
+          tasks: selectedTasks,
+          weights: params.weights,
+          detailed: params.detailed,
+          maxSolutions: params.maxSolutions,
+        },
+        user?.id
+      );
 
       setOptimizationResult(result);
       setCurrentStep("results");
@@ -236,12 +236,16 @@ const OPTIMIZER_BASE_URL =
   process.env.NEXT_PUBLIC_OPTIMIZER_URL || "http://localhost:8000";
 
 export const optimizerApi = {
-  // タスク最適化
-  optimizeTasks: (request: OptimizeRequest): Promise<OptimizeResponse> =>
+  // タスク最適化（tenantId はオプティマイザーの公平スケジューリングに使用）
+  optimizeTasks: (
+    request: OptimizeRequest,
+    tenantId?: number
+  ): Promise<OptimizeResponse> =>
     fetch(`${OPTIMIZER_BASE_URL}/optimize`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        ...(tenantId !== undefined && { "X-Tenant-ID": `user-${tenantId}` }),
       },
       body: JSON.stringify(request),
     }).then(async (response) => {
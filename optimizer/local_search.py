@@ -0,0 +1,184 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+class IncrementalEvaluator:
+  """
+  差分評価器
+
+  TaskSchedulingProblem と同じ3目的（優先度・効率性・制約違反）を
+  問題クラスのタスク単位の計算（task_priority_score 等）で前計算した値から求め、
+  区間 [lo, hi] 内の並べ替えによる目的関数の変化量を O(k)（k = 区間長）で計算する
+
+  - 優先度・効率性: 位置重みが変わるのは区間内のみ
+  - 締切制約: 完了時刻が変わるのは区間内のみ（区間後の累積時間は不変）
+  - 依存関係制約: 前後関係が変わるのは区間内のタスク同士のみ
+  """
+
+  def __init__(self, problem):
+    tasks = problem.tasks
+    self.problem = problem
+    self.n_tasks = len(tasks)
+
+    # タスクごとの優先度・効率性スコア（位置重みを掛ける前の値）と位置重み
+    self.priority = [problem.task_priority_score(task) for task in tasks]
+    self.efficiency = [problem.task_efficiency_score(task) for task in tasks]
+    self.position_weight = [problem.position_weight(position) for position in range(self.n_tasks)]
+
+    # 所要時間（時間単位）
+    self.duration_hours = [task['duration'] / 60.0 for task in tasks]
+
+    # 依存関係をインデックスで保持（重複もそのまま違反回数に反映する）
+    self.dependencies = [
+      [problem.task_id_to_index[dep_id] for dep_id in (task['dependencies'] or []) if dep_id in problem.task_id_to_index]
+      for task in tasks
+    ]
+
+    # 開始時刻から締切までの猶予（時間単位）。締切なしは None
+    # 解析エラーは順序に依存しない固定の違反として扱う
+    start_time = problem.schedule_start()
+    self.slack_hours: List[Optional[float]] = []
+    self.fixed_violation = 0.0
+    for task in tasks:
+      slack = None
+      if task['deadline']:
+        try:
+          slack = (problem.parse_deadline(task['deadline']) - start_time).total_seconds() / 3600
+        except Exception:
+          self.fixed_violation += problem.DEADLINE_PARSE_ERROR_VIOLATION
+      self.slack_hours.append(slack)
+
+  def _deadline_penalty(self, index: int, completion_hours: float) -> float:
+    """完了時刻における締切違反スコア"""
+    slack = self.slack_hours[index]
+    if slack is None:
+      return 0.0
+    return self.problem.deadline_penalty(completion_hours - slack)
+
+  def _dependency_violation(self, segment: Sequence[int]) -> float:
+    """区間内のタスク同士の依存関係違反スコア"""
+    positions = {index: pos for pos, index in enumerate(segment)}
+    violation = 0.0
+    for pos, index in enumerate(segment):
+      for dep in self.dependencies[index]:
+        dep_pos = positions.get(dep)
+        if dep_pos is not None and dep_pos > pos:
+          violation += self.problem.DEPENDENCY_VIOLATION
+    return violation
+
+  def evaluate(self, order: Sequence[int]) -> Tuple[float, float, float]:
+    """順列全体の目的関数値（優先度, 効率性, 制約違反）を計算"""
+    priority = 0.0
+    efficiency = 0.0
+    violation = self.fixed_violation + self._dependency_violation(order)
+    completion = 0.0
+    for pos, index in enumerate(order):
+      weight = self.position_weight[pos]
+      priority += self.priority[index] * weight
+      efficiency += self.efficiency[index] * weight
+      completion += self.duration_hours[index]
+      violation += self._deadline_penalty(index, completion)
+    return priority, efficiency, violation
+
+  def segment_delta(self, old_segment: Sequence[int], new_segment: Sequence[int],
+                    lo: int, start_hours: float) -> Tuple[float, float, float]:
+    """
+    区間 [lo, lo+k) を old_segment から new_segment に置き換えたときの差分
+
+    Args:
+      old_segment: 置き換え前の区間
+      new_segment: 置き換え後の区間（old_segment の並べ替え）
+      lo: 区間の開始位置
+      start_hours: 区間開始時点の累積所要時間（時間単位）
+
+    Returns:
+      (優先度の差分, 効率性の差分, 制約違反の差分)
+    """
+    d_priority = 0.0
+    d_efficiency = 0.0
+    d_violation = self._dependency_violation(new_segment) - self._dependency_violation(old_segment)
+
+    old_completion = start_hours
+    new_completion = start_hours
+    for offset, (old_index, new_index) in enumerate(zip(old_segment, new_segment)):
+      if old_index == new_index and old_completion == new_completion:
+        old_completion += self.duration_hours[old_index]
+        new_completion = old_completion
+        continue
+      weight = self.position_weight[lo + offset]
+      d_priority += (self.priority[new_index] - self.priority[old_index]) * weight
+      d_efficiency += (self.efficiency[new_index] - self.efficiency[old_index]) * weight
+      old_completion += self.duration_hours[old_index]
+      new_completion += self.duration_hours[new_index]
+      d_violation += self._deadline_penalty(new_index, new_completion) - self._deadline_penalty(old_index, old_completion)
+
+    return d_priority, d_efficiency, d_violation
+
+class LocalSearchRefiner:
+  """
+  メメティック局所探索
+
+  NSGA-IIのエリート解に対して、隣接交換・2-opt（区間反転）・挿入の
+  近傍を最良改善が得られなくなるまで適用する（first-improvement）
+  評価値は 優先度 + 効率性 - 制約違反（total_score と同じ基準）
+
+  近傍は区間長 window 以下に制限し、1手の評価を O(window) に抑える
+  deadline（time.perf_counter() の時刻）を過ぎた場合はその時点の順列を返す
+  """
+
+  def __init__(self, evaluator: IncrementalEvaluator, window: int = 8, max_passes: int = 20):
+    self.evaluator = evaluator
+    self.window = max(2, window)
+    self.max_passes = max_passes
+
+  def _moves(self, order: List[int], lo: int):
+    """lo から始まる区間の近傍（隣接交換・2-opt・挿入）を列挙"""
+    n = len(order)
+    for hi in range(lo + 1, min(n, lo + self.window)):
+      segment = order[lo:hi + 1]
+      # 隣接交換 / 2-opt（区間反転）: 長さ2の反転は隣接交換と同じ
+      yield hi, segment[::-1]
+      if hi - lo >= 2:
+        # 挿入: 先頭を末尾へ、末尾を先頭へ
+        yield hi, segment[1:] + segment[:1]
+        yield hi, segment[-1:] + segment[:-1]
+
+  def refine(self, order: Sequence[int], deadline: Optional[float] = None) -> Tuple[List[int], int]:
+    """
+    順列を局所探索で改善する
+
+    Args:
+      order: 初期順列（タスクインデックスの並び）
+      deadline: 打ち切り時刻（time.perf_counter() 基準、None は無制限）
+
+    Returns:
+      (改善後の順列, 採用した手の数)
+    """
+    evaluator = self.evaluator
+    order = list(order)
+    n = len(order)
+    accepted = 0
+
+    # 各位置の開始時点の累積所要時間
+    start_hours = [0.0] * (n + 1)
+    for pos, index in enumerate(order):
+      start_hours[pos + 1] = start_hours[pos] + evaluator.duration_hours[index]
+
+    for _ in range(self.max_passes):
+      improved = False
+      for lo in range(n - 1):
+        if deadline is not None and time.perf_counter() > deadline:
+          return order, accepted
+        for hi, new_segment in self._moves(order, lo):
+          d_priority, d_efficiency, d_violation = evaluator.segment_delta(
+            order[lo:hi + 1], new_segment, lo, start_hours[lo]
+          )
+          if d_priority + d_efficiency - d_violation > 1e-9:
+            order[lo:hi + 1] = new_segment
+            for pos in range(lo, hi + 1):
+              start_hours[pos + 1] = start_hours[pos] + evaluator.duration_hours[order[pos]]
+            accepted += 1
+            improved = True
+      if not improved:
+        break
+
+    return order, accepted
@@ -1,11 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Union
 from datetime import datetime
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from wire_format import WireFormatRoute, encode_response, build_compact_result
+from profiling import create_profiler
+from scheduler import FairScheduler, TenantLimitExceeded, parse_tenant_weights
 import logging
+import os
 
 load_dotenv()
 
@@ -19,6 +25,18 @@ app = FastAPI(
   version="1.0.0"
 )
 
+# MessagePack・gzip/zstd圧縮リクエストに対応
+app.router.route_class = WireFormatRoute
+
+# 最適化処理のスケジューラ（テナント間の公平性・interactive優先）
+scheduler = FairScheduler(
+  slots=int(os.getenv("OPTIMIZER_WORKER_SLOTS", "2")),
+  interactive_max_tasks=int(os.getenv("OPTIMIZER_INTERACTIVE_MAX_TASKS", "50")),
+  tenant_weights=parse_tenant_weights(os.getenv("OPTIMIZER_TENANT_WEIGHTS")),
+  tenant_ttl=float(os.getenv("OPTIMIZER_TENANT_TTL", "600")),
+  max_tenants=int(os.getenv("OPTIMIZER_MAX_TENANTS", "1000"))
+)
+
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
@@ -56,6 +74,10 @@ class OptimizeRequest(BaseModel):
   weights: Optional[OptimizationWeights] = None
   detailed: bool = False  # 詳細結果を返すかどうか
   max_solutions: int = 1  # 返却する解の数（1=最良解のみ、10=上位10解）
+  compact: bool = False  # 詳細結果をコンパクト形式（タスク情報1回＋インデックス配列）で返すかどうか
+  profile: bool = False  # プロファイル結果を返すかどうか（OPTIMIZER_PROFILING=enabled の場合のみ有効）
+  local_search: bool = True  # エリート解に局所探索を適用するかどうか（NSGA-IIの後に最大 ls_time_limit 秒かかる）
+  ls_time_limit: float = Field(1.0, ge=0.0, le=10.0)  # 局所探索全体の制限時間（秒）
 
 class OptimizedTask(BaseModel):
   """最適化結果のタスクモデル"""
@@ -71,6 +93,7 @@ class OptimizeResponse(BaseModel):
   total_tasks: int
   algorithm_used: str
   execution_time_ms: float
+  profile: Optional[dict] = None
 
 class DetailedOptimizeResponse(BaseModel):
   """詳細最適化レスポンスのモデル"""
@@ -100,17 +123,45 @@ def health_check():
     "version": "1.0.0"
   }
 
+@app.get("/optimizer/scheduler/stats")
+async def scheduler_stats():
+  """
+  テナントごとのキュー長・待ち時間
+
+  スケジューラの状態を変更するイベントループ上で読むため async で定義する
+  """
+  return scheduler.stats()
+
 @app.post("/optimizer/optimize", response_model=Union[OptimizeResponse, dict])
-def optimize_tasks(request: OptimizeRequest):
+async def optimize_tasks(request: OptimizeRequest, http_request: Request):
   """
   タスクの優先順位を最適化するエンドポイント
 
+  リクエストはJSON・MessagePack（Content-Type: application/msgpack）、
+  gzip/zstd圧縮（Content-Encoding）に対応
+  レスポンスは Accept / Accept-Encoding に従ってエンコードする
+  最適化処理は X-Tenant-ID ヘッダーのテナントごとにスケジューラで順番待ちする
+
   Args:
     request: 最適化対象のタスクリスト
+    http_request: HTTPリクエスト（レスポンス形式のネゴシエーション用）
 
   Returns:
     OptimizeResponse: 最適化されたタスクリスト
   """
+  tenant = http_request.headers.get("x-tenant-id") or "default"
+
+  # スロットの待機はイベントループ上で行い、スレッドプールを占有しない
+  try:
+    async with scheduler.slot(tenant, len(request.tasks)) as job_class:
+      logger.info(f"スケジュール: テナント {tenant}, クラス {job_class}")
+      return await run_in_threadpool(_optimize_tasks, request, http_request)
+  except TenantLimitExceeded as e:
+    logger.warning(f"テナント数上限: {str(e)}")
+    raise HTTPException(status_code=429, detail=str(e))
+
+def _optimize_tasks(request: OptimizeRequest, http_request: Request):
+  """最適化処理の本体（ワーカースロット内・スレッドプールで実行）"""
   try:
     import time
     start_time = time.time()
@@ -129,34 +180,53 @@ def optimize_tasks(request: OptimizeRequest):
     if request.weights:
       weights_dict = request.weights.dict()
 
-    # NSGA-II多目的最適化を実行
-    from optimizer import run_nsga2_optimization
-
-    nsga2_result = run_nsga2_optimization(
-      tasks_dict,
-      pop_size=min(50, len(request.tasks) * 10),  # タスク数に応じて調整
-      n_gen=min(100, 50 + len(request.tasks) * 5),  # タスク数に応じて調整
-      weights=weights_dict
-    )
-
-    # 最良解を取得
-    best_solution = nsga2_result["best_solution"]
-    if not best_solution:
-      raise HTTPException(status_code=500, detail="最適化解が見つかりませんでした")
-
-    # レスポンス形式に変換
-    result_tasks = []
-    for task_info in best_solution["task_order"]:
-      # 元のタスク情報を取得
-      original_task = next(task for task in request.tasks if task.id == task_info["id"])
-
-      result_tasks.append(OptimizedTask(
-        id=task_info["id"],
-        title=task_info["title"],
-        priority_score=best_solution["objectives"]["total_score"],
-        rank=task_info["position"],
-        original_task=original_task
-      ))
+    # プロファイリング（デフォルト無効。フラグまたは管理者ヘッダーで有効化）
+    profiler = create_profiler(request.profile, http_request.headers.get("x-optimizer-profile-token"))
+    if profiler:
+      logger.info("プロファイリング有効")
+
+    with profiler or nullcontext():
+      # NSGA-II多目的最適化を実行
+      from optimizer import run_nsga2_optimization
+
+      nsga2_result = run_nsga2_optimization(
+        tasks_dict,
+        pop_size=min(50, len(request.tasks) * 10),  # タスク数に応じて調整
+        n_gen=min(100, 50 + len(request.tasks) * 5),  # タスク数に応じて調整
+        weights=weights_dict,
+        local_search=request.local_search,
+        ls_time_limit=request.ls_time_limit
+      )
+
+      # 最良解を取得
+      best_solution = nsga2_result["best_solution"]
+      if not best_solution:
+        raise HTTPException(status_code=500, detail="最適化解が見つかりませんでした")
+
+      # レスポンス形式に変換
+      result_tasks = []
+      for task_info in best_solution["task_order"]:
+        # 元のタスク情報を取得
+        original_task = next(task for task in request.tasks if task.id == task_info["id"])
+
+        result_tasks.append(OptimizedTask(
+          id=task_info["id"],
+          title=task_info["title"],
+          priority_score=best_solution["objectives"]["total_score"],
+          rank=task_info["position"],
+          original_task=original_task
+        ))
+
+    profile = None
+    if profiler:
+      profile = profiler.result()
+      if profile["skipped"]:
+        logger.info("他のリクエストを計測中のため、プロファイリングをスキップしました")
+      else:
+        profile_dir = os.getenv("OPTIMIZER_PROFILE_DIR")
+        if profile_dir:
+          profile["saved_to"] = profiler.save(profile_dir)
+        logger.info(f"プロファイル結果: {profile['samples']}サンプル, 計測時間 {profile['elapsed_ms']}ms")
 
     execution_time = (time.time() - start_time) * 1000  # ミリ秒
 
@@ -184,16 +254,25 @@ def optimize_tasks(request: OptimizeRequest):
       # numpy型を変換
       converted_result = convert_numpy_types(nsga2_result)
 
-      # JSONResponseを使用してPydanticモデルの制約を回避
-      return JSONResponse(content=converted_result)
+      # コンパクト形式: タスク情報は1回だけ、各解はインデックス配列
+      if request.compact:
+        converted_result = build_compact_result(converted_result, tasks_dict)
+
+      if profile:
+        converted_result["profile"] = profile
+
+      # Pydanticモデルの制約を回避して直接エンコード
+      return encode_response(converted_result, http_request)
 
     # 標準レスポンス
-    return OptimizeResponse(
+    response = OptimizeResponse(
       optimized_tasks=result_tasks,
       total_tasks=len(result_tasks),
       algorithm_used=f"NSGA-II Multi-Objective Optimization (pop_size={nsga2_result['parameters']['population_size']}, gen={nsga2_result['parameters']['generations']})",
-      execution_time_ms=round(execution_time, 2)
+      execution_time_ms=round(execution_time, 2),
+      profile=profile
     )
+    return encode_response(jsonable_encoder(response), http_request)
 
   except Exception as e:
     logger.error(f"最適化エラー: {str(e)}")
@@ -1,10 +1,12 @@
 import json
+import time
 import numpy as np
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any
 from pymoo.algorithms.moo.nsga2 import NSGA2
 from pymoo.core.problem import ElementwiseProblem
 from pymoo.optimize import minimize
+from local_search import IncrementalEvaluator, LocalSearchRefiner
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,8 +21,18 @@ class TaskSchedulingProblem(ElementwiseProblem):
   3. 制約違反の最小化（依存関係・締切制約）
 
   注意: この問題は順列最適化問題として扱う
+
+  タスク単位の計算（task_priority_score・task_efficiency_score・position_weight・
+  schedule_start・parse_deadline・deadline_penalty）は局所探索の差分評価
+  （local_search.IncrementalEvaluator）からも使用する
   """
 
+  # 依存関係違反1件あたりの違反スコア
+  DEPENDENCY_VIOLATION = 10.0
+
+  # 締切の解析エラー1件あたりの違反スコア
+  DEADLINE_PARSE_ERROR_VIOLATION = 1.0
+
   def __init__(self, tasks: List[Dict[str, Any]], weights: Dict[str, float] = None):
     self.tasks = tasks
     self.n_tasks = len(tasks)
@@ -57,6 +69,15 @@ class TaskSchedulingProblem(ElementwiseProblem):
     # 連続値を順列に変換（ランキングベース）
     indices = np.argsort(x)  # xの値でソートしたインデックスを取得
 
+    out["F"] = self.evaluate_order(indices)
+
+  def evaluate_order(self, indices) -> List[float]:
+    """
+    順列（タスクインデックスの並び）の目的関数値を計算
+
+    Returns:
+      [-優先度, -効率性, 制約違反]（最小化形式）
+    """
     # 実行順序に従ってタスクを並べる
     ordered_tasks = [self.tasks[i] for i in indices]
 
@@ -66,7 +87,7 @@ class TaskSchedulingProblem(ElementwiseProblem):
     f3 = self._calculate_constraint_violation(ordered_tasks, indices)
 
     # NSGA-IIは最小化問題なので、最大化したい目的は負の値にする
-    out["F"] = [-f1, -f2, f3]  # 優先度と効率性は最大化、制約違反は最小化
+    return [-f1, -f2, f3]  # 優先度と効率性は最大化、制約違反は最小化
 
   def _calculate_priority_objective(self, ordered_tasks: List[Dict]) -> float:
     """
@@ -78,20 +99,23 @@ class TaskSchedulingProblem(ElementwiseProblem):
     total_score = 0.0
 
     for position, task in enumerate(ordered_tasks):
-      # 基本優先度スコア（ユーザー設定の重みを使用）
-      priority_score = (
-        task['importance'] * self.weights.get('importance', 3.0) +
-        task['urgency'] * self.weights.get('urgency', 2.0) +
-        (6 - task['ease']) * self.weights.get('ease', 1.0)
-      )
-
       # 位置によるペナルティ（後ろほど大きなペナルティ）
-      position_penalty = 1.0 / (position + 1)
-
-      total_score += priority_score * position_penalty
+      total_score += self.task_priority_score(task) * self.position_weight(position)
 
     return total_score
 
+  def task_priority_score(self, task: Dict) -> float:
+    """タスク単体の基本優先度スコア（ユーザー設定の重みを使用）"""
+    return (
+      task['importance'] * self.weights.get('importance', 3.0) +
+      task['urgency'] * self.weights.get('urgency', 2.0) +
+      (6 - task['ease']) * self.weights.get('ease', 1.0)
+    )
+
+  def position_weight(self, position: int) -> float:
+    """実行位置による重み（後ろほど小さい）"""
+    return 1.0 / (position + 1)
+
   def _calculate_efficiency_objective(self, ordered_tasks: List[Dict]) -> float:
     """
     効率性目的関数の計算
@@ -101,27 +125,27 @@ class TaskSchedulingProblem(ElementwiseProblem):
     total_efficiency = 0.0
 
     for position, task in enumerate(ordered_tasks):
-      # エネルギー効率（必要エネルギーが少ないほど良い）
-      energy_efficiency = (11 - task['energy_required']) / 10.0
-
-      # 時間効率（短時間で完了できるタスクを優先）
-      time_efficiency = 1.0 / (task['duration'] / 60.0 + 1)  # 時間単位に変換
+      # 位置による重み付け
+      total_efficiency += self.task_efficiency_score(task) * self.position_weight(position)
 
-      # 容易さによる効率性（簡単なタスクは効率的）
-      ease_efficiency = task['ease'] / 5.0
+    return total_efficiency
 
-      efficiency_score = (
-        energy_efficiency * self.weights.get('energy', 2.0) +
-        time_efficiency * self.weights.get('time', 1.5) +
-        ease_efficiency * self.weights.get('ease', 1.0)
-      )
+  def task_efficiency_score(self, task: Dict) -> float:
+    """タスク単体の効率性スコア"""
+    # エネルギー効率（必要エネルギーが少ないほど良い）
+    energy_efficiency = (11 - task['energy_required']) / 10.0
 
-      # 位置による重み付け
-      position_weight = 1.0 / (position + 1)
+    # 時間効率（短時間で完了できるタスクを優先）
+    time_efficiency = 1.0 / (task['duration'] / 60.0 + 1)  # 時間単位に変換
 
-      total_efficiency += efficiency_score * position_weight
+    # 容易さによる効率性（簡単なタスクは効率的）
+    ease_efficiency = task['ease'] / 5.0
 
-    return total_efficiency
+    return (
+      energy_efficiency * self.weights.get('energy', 2.0) +
+      time_efficiency * self.weights.get('time', 1.5) +
+      ease_efficiency * self.weights.get('ease', 1.0)
+    )
 
   def _calculate_constraint_violation(self, ordered_tasks: List[Dict], order_array: np.ndarray) -> float:
     """
@@ -141,46 +165,112 @@ class TaskSchedulingProblem(ElementwiseProblem):
             dep_position = task_positions[dep_id]
             if dep_position > position:
               # 依存タスクが後に実行される場合は制約違反
-              violation_score += 10.0
+              violation_score += self.DEPENDENCY_VIOLATION
 
     # 締切制約の確認
-    current_time = datetime.now()  # 現在時刻から開始
+    current_time = self.schedule_start()  # 現在時刻から開始
     for task in ordered_tasks:
       # タスクの実行時間を加算
       current_time += timedelta(minutes=task['duration'])
 
       if task['deadline']:
         try:
-          # 締切時間の解析（ISO形式の日時文字列を想定）
-          if isinstance(task['deadline'], str):
-            # ISO形式の日時文字列をパース
-            deadline = datetime.fromisoformat(task['deadline'].replace('Z', '+00:00'))
-          else:
-            # 既にdatetimeオブジェクトの場合
-            deadline = task['deadline']
-
-          # タイムゾーンを考慮した比較
-          if current_time.tzinfo is None:
-            current_time = current_time.replace(tzinfo=timezone.utc)
-          if deadline.tzinfo is None:
-            deadline = deadline.replace(tzinfo=timezone.utc)
-
-          # 締切を過ぎている場合は制約違反
-          if current_time > deadline:
-            # 遅延時間に応じて違反スコアを計算（時間単位）
-            delay_hours = (current_time - deadline).total_seconds() / 3600
-            violation_score += min(delay_hours * 2.0, 20.0)  # 最大20点の違反
+          deadline = self.parse_deadline(task['deadline'])
+
+          # 遅延時間に応じて違反スコアを計算（時間単位）
+          delay_hours = (current_time - deadline).total_seconds() / 3600
+          violation_score += self.deadline_penalty(delay_hours)
         except Exception as e:
           # 日時解析エラーの場合は軽微な違反として扱う
           logger.warning(f"締切解析エラー: {task['deadline']} - {str(e)}")
-          violation_score += 1.0
+          violation_score += self.DEADLINE_PARSE_ERROR_VIOLATION
 
     return violation_score
 
+  def schedule_start(self) -> datetime:
+    """スケジュールの開始時刻（現在時刻、タイムゾーン付き）"""
+    current_time = datetime.now()
+    if current_time.tzinfo is None:
+      current_time = current_time.replace(tzinfo=timezone.utc)
+    return current_time
+
+  def parse_deadline(self, value) -> datetime:
+    """締切の解析（ISO形式の日時文字列またはdatetime、タイムゾーン付きで返す）"""
+    if isinstance(value, str):
+      # ISO形式の日時文字列をパース
+      deadline = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+      # 既にdatetimeオブジェクトの場合
+      deadline = value
+
+    # タイムゾーンを考慮した比較
+    if deadline.tzinfo is None:
+      deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline
+
+  def deadline_penalty(self, delay_hours: float) -> float:
+    """締切超過時間に応じた違反スコア（締切を過ぎていなければ0、最大20点）"""
+    if delay_hours <= 0:
+      return 0.0
+    return min(delay_hours * 2.0, 20.0)
+
+def _refine_elites(problem: TaskSchedulingProblem,
+                   candidates: List[tuple],
+                   ls_elites: int,
+                   ls_window: int,
+                   ls_max_passes: int,
+                   ls_time_limit: float) -> List[tuple]:
+  """
+  総合スコア上位のエリート解に局所探索を適用する
+
+  Args:
+    problem: 最適化問題
+    candidates: (順列, 目的関数値) のリスト
+    ls_elites: 局所探索を適用するエリート解の数
+    ls_window: 近傍の最大区間長
+    ls_max_passes: 最大パス数
+    ls_time_limit: 局所探索全体の制限時間（秒）
+
+  Returns:
+    エリート解を改善後の順列に置き換えた候補リスト
+  """
+  evaluator = IncrementalEvaluator(problem)
+  refiner = LocalSearchRefiner(evaluator, window=ls_window, max_passes=ls_max_passes)
+
+  # 総合スコア（-F1 - F2 - F3）の高い順にエリートを選ぶ
+  ranked = sorted(range(len(candidates)), key=lambda i: sum(candidates[i][1]))
+  seen = {tuple(order.tolist()) for order, _ in candidates}
+  refined = list(candidates)
+  total_moves = 0
+  deadline = time.perf_counter() + ls_time_limit
+
+  for i in ranked[:ls_elites]:
+    if time.perf_counter() > deadline:
+      break
+    order, moves = refiner.refine(candidates[i][0].tolist(), deadline=deadline)
+    key = tuple(order)
+    if moves == 0 or key in seen:
+      continue
+    seen.add(key)
+    total_moves += moves
+
+    # 最終的な目的関数値は元の評価関数で計算し直す
+    order = np.array(order)
+    refined[i] = (order, np.array(problem.evaluate_order(order)))
+
+  logger.info(f"局所探索完了: エリート{min(ls_elites, len(candidates))}解, 採用した手 {total_moves}")
+
+  return refined
+
 def run_nsga2_optimization(tasks: List[Dict[str, Any]],
                           pop_size: int = 50,
                           n_gen: int = 100,
-                          weights: Dict[str, float] = None) -> Dict[str, Any]:
+                          weights: Dict[str, float] = None,
+                          local_search: bool = True,
+                          ls_elites: int = 5,
+                          ls_window: int = 8,
+                          ls_max_passes: int = 20,
+                          ls_time_limit: float = 1.0) -> Dict[str, Any]:
   """
   NSGA-II多目的最適化の実行
 
@@ -189,6 +279,11 @@ def run_nsga2_optimization(tasks: List[Dict[str, Any]],
     pop_size: 集団サイズ
     n_gen: 世代数
     weights: 目的関数の重み設定
+    local_search: エリート解に局所探索（メメティック改善）を適用するかどうか
+    ls_elites: 局所探索を適用するエリート解の数
+    ls_window: 局所探索の近傍の最大区間長
+    ls_max_passes: 局所探索の最大パス数
+    ls_time_limit: 局所探索全体の制限時間（秒）。NSGA-IIの実行時間に加算される
 
   Returns:
     最適化結果
@@ -241,13 +336,17 @@ def run_nsga2_optimization(tasks: List[Dict[str, Any]],
   solutions = []
 
   try:
-    for i, individual in enumerate(result.pop):
-      # 連続値を順列に変換
-      order_indices = np.argsort(individual.X)
+    # 連続値を順列に変換
+    candidates = [(np.argsort(individual.X), individual.F) for individual in result.pop]
+
+    # エリート解の局所探索（差分評価で順序を磨く）
+    if local_search and len(tasks) > 1 and ls_elites > 0:
+      candidates = _refine_elites(problem, candidates, ls_elites, ls_window, ls_max_passes, ls_time_limit)
+
+    for i, (order_indices, objectives) in enumerate(candidates):
       ordered_tasks = [tasks[idx] for idx in order_indices]
 
       # 目的関数値（元の値に戻す）
-      objectives = individual.F
       priority_score = -objectives[0] if len(objectives) > 0 else 0.0
       efficiency_score = -objectives[1] if len(objectives) > 1 else 0.0
       constraint_violation = objectives[2] if len(objectives) > 2 else 0.0
@@ -330,6 +429,7 @@ def run_nsga2_optimization(tasks: List[Dict[str, Any]],
     "parameters": {
       "population_size": pop_size,
       "generations": n_gen,
+      "local_search": local_search,
       "objectives": ["priority", "efficiency", "constraint_violation"]
     },
     "solutions": solutions[:10],  # 上位10解を返す
@@ -0,0 +1,238 @@
+import hmac
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# サンプリング間隔（秒）
+DEFAULT_INTERVAL = 0.002
+
+# 計測中のスレッドスイッチ間隔（秒）
+PROFILING_SWITCH_INTERVAL = 0.00001
+
+# スイッチ間隔はプロセス全体の設定のため、同時に計測するのは1リクエストのみ
+_profiling_lock = threading.Lock()
+
+# 内訳の分類に使う関数名（main.py・optimizer.py の関数名を変更した場合はここも更新する）
+PROFILED_FUNCTIONS = {
+  "priority_objective": ("_calculate_priority_objective",),
+  "efficiency_objective": ("_calculate_efficiency_objective",),
+  "constraint_violation": ("_calculate_constraint_violation",),
+  "evaluation": ("_evaluate", "evaluate_order"),
+  "result_building": ("run_nsga2_optimization", "_optimize_tasks"),
+}
+
+def _named(category: str):
+  names = PROFILED_FUNCTIONS[category]
+  return category, lambda code: code.co_name in names
+
+# 内訳の分類（スタックの内側から最初に一致したものを採用）
+PROFILE_CATEGORIES = [
+  _named("priority_objective"),
+  _named("efficiency_objective"),
+  _named("constraint_violation"),
+  _named("evaluation"),
+  ("local_search", lambda code: os.path.basename(code.co_filename) == "local_search.py"),
+  ("pymoo", lambda code: f"{os.sep}pymoo{os.sep}" in code.co_filename),
+  _named("result_building"),
+]
+
+def _admin_token_valid(admin_token: Optional[str]) -> bool:
+  """X-Optimizer-Profile-Token ヘッダーが環境変数 OPTIMIZER_PROFILE_TOKEN と一致するか"""
+  expected_token = os.getenv("OPTIMIZER_PROFILE_TOKEN")
+  return bool(admin_token and expected_token and hmac.compare_digest(admin_token.encode("utf-8"), expected_token.encode("utf-8")))
+
+def create_profiler(request_flag: bool, admin_token: Optional[str]) -> Optional["SamplingProfiler"]:
+  """
+  リクエストに応じたプロファイラを作成
+
+  デフォルトでは無効。以下のいずれかの場合のみ有効にする
+  - X-Optimizer-Profile-Token ヘッダーが環境変数 OPTIMIZER_PROFILE_TOKEN と一致:
+    スイッチ間隔を短くして計測する（プロセス全体が遅くなるため管理者のみ）
+  - 環境変数 OPTIMIZER_PROFILING=enabled かつリクエストの profile フラグが true:
+    スイッチ間隔は変更しない（認証されないため、他のリクエストに影響を与えない）
+
+  Args:
+    request_flag: リクエストの profile フラグ
+    admin_token: X-Optimizer-Profile-Token ヘッダーの値
+
+  Returns:
+    プロファイラ（プロファイリングを行わない場合は None）
+  """
+  if _admin_token_valid(admin_token):
+    return SamplingProfiler()
+  if request_flag and os.getenv("OPTIMIZER_PROFILING", "disabled") == "enabled":
+    return SamplingProfiler(switch_interval=None)
+  return None
+
+def _frame_label(code) -> str:
+  """flamegraph用のフレーム名（関数名 (ファイル:行)）"""
+  filename = code.co_filename
+  if "site-packages" in filename:
+    filename = filename.split("site-packages" + os.sep, 1)[-1]
+  else:
+    filename = os.path.basename(filename)
+  return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+def _categorize(code) -> Optional[str]:
+  """フレームのカテゴリ（一致しない場合は None）"""
+  return next((name for name, match in PROFILE_CATEGORIES if match(code)), None)
+
+class SamplingProfiler:
+  """
+  リクエスト単位のサンプリングプロファイラ
+
+  別スレッドから with文を実行しているスレッドのスタックを一定間隔で取得し、
+  flamegraph.pl / speedscope で読める folded stack 形式と、
+  目的関数・pymoo内部・結果構築ごとの内訳を出力する
+
+  サンプリングスレッドはGILを取得するまで最大でスイッチ間隔（既定5ms）待たされ、
+  その間にnumpy等がGILを解放した箇所ばかりが記録されてしまうため、
+  計測中のみスイッチ間隔を短くしてサンプルの偏りを抑える
+  スイッチ間隔はプロセス全体に効き、同時に処理中の他のリクエストも遅くなるため、
+  計測は同時に1リクエストのみとし、計測中に来たリクエストは計測せずに処理する（skipped）
+  switch_interval=None の場合はスイッチ間隔を変更せず（内訳は偏る）、同時計測も制限しない
+
+  使用例:
+    with SamplingProfiler() as profiler:
+      run_nsga2_optimization(tasks)
+    profile = profiler.result()
+  """
+
+  def __init__(self, interval: float = DEFAULT_INTERVAL, switch_interval: Optional[float] = PROFILING_SWITCH_INTERVAL):
+    self.interval = interval
+    self.switch_interval = switch_interval
+    self.stacks = Counter()
+    self.categories = Counter()
+    self.samples = 0
+    self.elapsed = 0.0
+    self._codes = {}
+    self._stop = threading.Event()
+    self._thread = None
+    self._target_id = None
+    self._root_frame = None
+    self.root_category = None
+    self.skipped = False
+    self._original_switch_interval = None
+    self._started_at = 0.0
+
+  def __enter__(self):
+    if self.switch_interval is not None and not _profiling_lock.acquire(blocking=False):
+      # 他のリクエストを計測中
+      self.skipped = True
+      return self
+
+    self._target_id = threading.get_ident()
+    # with文を呼び出したフレームより外側（サーバーのスレッドプール等）は記録しない
+    self._root_frame = sys._getframe(1)
+    # 根のフレームが分類に一致しない場合、結果構築の時間が other になる
+    self.root_category = _categorize(self._root_frame.f_code) or "other"
+    self._original_switch_interval = sys.getswitchinterval()
+    if self.switch_interval is not None:
+      sys.setswitchinterval(self.switch_interval)
+    self._started_at = time.perf_counter()
+    self._thread = threading.Thread(target=self._run, name="optimizer-profiler", daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if self.skipped:
+      return False
+    self._stop.set()
+    self._thread.join()
+    self.elapsed = time.perf_counter() - self._started_at
+    self._root_frame = None
+    if self.switch_interval is not None:
+      sys.setswitchinterval(self._original_switch_interval)
+      _profiling_lock.release()
+    return False
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self._target_id)
+      if frame is not None:
+        self._sample(frame)
+
+  def _sample(self, frame):
+    """スタックを1件記録"""
+    labels = []
+    category = None
+    while frame is not None:
+      code = frame.f_code
+      if code not in self._codes:
+        self._codes[code] = (_frame_label(code), _categorize(code))
+      label, frame_category = self._codes[code]
+      labels.append(label)
+      # 内側から最初に一致したカテゴリを採用
+      category = category or frame_category
+      if frame is self._root_frame:
+        break
+      frame = frame.f_back
+
+    self.stacks[";".join(reversed(labels))] += 1
+    self.categories[category or "other"] += 1
+    self.samples += 1
+
+  def folded(self) -> str:
+    """folded stack 形式（"frame;frame;frame サンプル数" の行）"""
+    return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+  def result(self) -> Dict[str, Any]:
+    """
+    プロファイル結果
+
+    Returns:
+      サンプル数・カテゴリ別内訳・folded stack を含む辞書
+      （他のリクエストを計測中だった場合は skipped のみ）
+    """
+    if self.skipped:
+      return {"format": "folded", "skipped": True}
+
+    elapsed_ms = self.elapsed * 1000
+    breakdown = {}
+    for name in [name for name, _ in PROFILE_CATEGORIES] + ["other"]:
+      count = self.categories.get(name, 0)
+      ratio = count / self.samples if self.samples else 0.0
+      breakdown[name] = {
+        "samples": count,
+        "ratio": round(ratio, 4),
+        "estimated_ms": round(elapsed_ms * ratio, 2)
+      }
+
+    return {
+      "format": "folded",
+      "skipped": False,
+      "interval_ms": round(self.interval * 1000, 2),
+      "switch_interval_ms": round((self.switch_interval or self._original_switch_interval) * 1000, 3),
+      "elapsed_ms": round(elapsed_ms, 2),
+      "samples": self.samples,
+      "root_category": self.root_category,
+      "breakdown": breakdown,
+      "folded": self.folded()
+    }
+
+  def save(self, directory: str) -> Optional[str]:
+    """
+    folded stack をファイルに保存
+
+    Args:
+      directory: 保存先ディレクトリ
+
+    Returns:
+      保存したファイルパス（失敗時は None）
+    """
+    try:
+      os.makedirs(directory, exist_ok=True)
+      path = os.path.join(directory, f"optimize-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.folded")
+      with open(path, "w", encoding="utf-8") as f:
+        f.write(self.folded() + "\n")
+      return path
+    except Exception as e:
+      logger.warning(f"プロファイル保存エラー: {str(e)}")
+      return None
@@ -0,0 +1,239 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+JOB_CLASSES = (INTERACTIVE, BATCH)
+
+def parse_tenant_weights(value: Optional[str]) -> Dict[str, float]:
+  """
+  テナントの重み設定を解析
+
+  Args:
+    value: "tenant_a=2,tenant_b=0.5" 形式の文字列
+
+  Returns:
+    {テナントID: 重み}
+  """
+  weights = {}
+  for part in (value or "").split(","):
+    tenant, _, weight = part.strip().partition("=")
+    if not tenant or not weight:
+      continue
+    try:
+      weights[tenant.strip()] = max(float(weight), 0.01)
+    except ValueError:
+      logger.warning(f"テナント重みの解析エラー: {part}")
+  return weights
+
+class TenantLimitExceeded(Exception):
+  """追跡中のテナント数が上限に達し、新しいテナントを受け付けられない"""
+  pass
+
+class _Waiter:
+  """ワーカースロットの待機中ジョブ"""
+
+  __slots__ = ("tenant", "job_class", "start_tag", "enqueued_at", "future")
+
+  def __init__(self, tenant: str, job_class: str, start_tag: float, future: asyncio.Future):
+    self.tenant = tenant
+    self.job_class = job_class
+    self.start_tag = start_tag
+    self.enqueued_at = time.perf_counter()
+    self.future = future
+
+class _TenantState:
+  """テナントごとのキューと統計"""
+
+  def __init__(self, weight: float):
+    self.weight = weight
+    self.queues = {job_class: deque() for job_class in JOB_CLASSES}
+    self.finish_tag = 0.0
+    self.running = 0
+    self.completed = 0
+    self.total_wait = 0.0
+    self.max_wait = 0.0
+    self.last_active = time.perf_counter()
+
+  def idle(self) -> bool:
+    """待機中・実行中のジョブがないか"""
+    return self.running == 0 and not any(self.queues.values())
+
+class FairScheduler:
+  """
+  マルチテナント向けの公平なワーカースロットスケジューラ
+
+  - テナントごとのキュー（X-Tenant-ID ヘッダー）
+  - 重み付き公平キューイング（Start-time Fair Queuing）:
+    コスト（タスク数）/ 重み でテナントごとの仮想時刻を進め、
+    仮想開始時刻が最小のジョブから実行する
+  - タスク数が interactive_max_tasks 以下のジョブは interactive クラスとして
+    batch クラスより優先し、batch クラスが同時に使えるスロットは batch_slots までに制限する
+
+  X-Tenant-ID はクライアントが任意に指定できるため、ジョブのないテナントは
+  tenant_ttl 秒後に破棄し、追跡するテナント数を max_tenants までに制限する
+
+  asyncio のイベントループ上で使用する（スレッドセーフではない）
+
+  使用例:
+    async with scheduler.slot(tenant, len(tasks)):
+      result = await run_in_threadpool(run_nsga2_optimization, tasks)
+  """
+
+  def __init__(self,
+               slots: int = 2,
+               batch_slots: Optional[int] = None,
+               interactive_max_tasks: int = 50,
+               tenant_weights: Optional[Dict[str, float]] = None,
+               tenant_ttl: float = 600.0,
+               max_tenants: int = 1000):
+    self.slots = max(1, slots)
+    # interactive 用に最低1スロットを残す（スロットが1つの場合は共有）
+    self.batch_slots = max(1, min(self.slots - 1, batch_slots if batch_slots is not None else self.slots))
+    self.interactive_max_tasks = interactive_max_tasks
+    self.tenant_weights = tenant_weights or {}
+    self.tenant_ttl = tenant_ttl
+    self.max_tenants = max(1, max_tenants)
+
+    self.virtual_time = 0.0
+    self.running = {job_class: 0 for job_class in JOB_CLASSES}
+    self.tenants: Dict[str, _TenantState] = {}
+
+  def classify(self, n_tasks: int) -> str:
+    """タスク数からジョブクラスを判定"""
+    return INTERACTIVE if n_tasks <= self.interactive_max_tasks else BATCH
+
+  def _tenant(self, tenant: str) -> _TenantState:
+    if tenant not in self.tenants:
+      self._evict_idle_tenants()
+      if len(self.tenants) >= self.max_tenants:
+        raise TenantLimitExceeded(f"テナント数が上限（{self.max_tenants}）に達しています")
+      self.tenants[tenant] = _TenantState(self.tenant_weights.get(tenant, 1.0))
+    return self.tenants[tenant]
+
+  def _evict_idle_tenants(self):
+    """
+    ジョブのないテナントを破棄する
+
+    - 最後の活動から tenant_ttl 秒を過ぎたテナント
+    - 上限に達している場合は、最後の活動が古いテナントから順に1件分の空きを作る
+    """
+    now = time.perf_counter()
+    idle = sorted(
+      (state.last_active, tenant) for tenant, state in self.tenants.items() if state.idle()
+    )
+    for last_active, tenant in idle:
+      if now - last_active > self.tenant_ttl or len(self.tenants) >= self.max_tenants:
+        del self.tenants[tenant]
+      else:
+        break
+
+  def _next_waiter(self, job_class: str) -> Optional[_Waiter]:
+    """指定クラスで仮想開始時刻が最小のジョブ（各テナントの先頭のみ比較）"""
+    best = None
+    for state in self.tenants.values():
+      queue = state.queues[job_class]
+      if queue and (best is None or queue[0].start_tag < best.start_tag):
+        best = queue[0]
+    return best
+
+  def _dispatch(self):
+    """空きスロットに待機中のジョブを割り当てる"""
+    while sum(self.running.values()) < self.slots:
+      waiter = self._next_waiter(INTERACTIVE)
+      if waiter is None and self.running[BATCH] < self.batch_slots:
+        waiter = self._next_waiter(BATCH)
+      if waiter is None:
+        return
+
+      state = self.tenants[waiter.tenant]
+      state.queues[waiter.job_class].popleft()
+      if waiter.future.done():
+        # スロットの解放と同じループ内でキャンセルされたジョブ（slot() 側ではキューから削除しない）
+        continue
+      # interactive クラスは batch クラスを追い越すため、仮想時刻が戻らないようにする
+      self.virtual_time = max(self.virtual_time, waiter.start_tag)
+
+      wait = time.perf_counter() - waiter.enqueued_at
+      state.total_wait += wait
+      state.max_wait = max(state.max_wait, wait)
+      state.running += 1
+      self.running[waiter.job_class] += 1
+      waiter.future.set_result(None)
+
+  def _release(self, waiter: _Waiter):
+    state = self.tenants[waiter.tenant]
+    state.running -= 1
+    state.completed += 1
+    state.last_active = time.perf_counter()
+    self.running[waiter.job_class] -= 1
+    self._dispatch()
+
+  @asynccontextmanager
+  async def slot(self, tenant: str, n_tasks: int):
+    """
+    ワーカースロットを取得して処理を実行する
+
+    Args:
+      tenant: テナントID
+      n_tasks: タスク数（ジョブクラスの判定とコストに使用）
+
+    Raises:
+      TenantLimitExceeded: 追跡中のテナント数が上限に達している場合
+    """
+    state = self._tenant(tenant)
+    state.last_active = time.perf_counter()
+    job_class = self.classify(n_tasks)
+
+    # 仮想開始時刻 = max(現在の仮想時刻, テナントの前回ジョブの仮想終了時刻)
+    start_tag = max(self.virtual_time, state.finish_tag)
+    state.finish_tag = start_tag + max(1, n_tasks) / state.weight
+
+    waiter = _Waiter(tenant, job_class, start_tag, asyncio.get_running_loop().create_future())
+    state.queues[job_class].append(waiter)
+    self._dispatch()
+
+    try:
+      await waiter.future
+    except asyncio.CancelledError:
+      # クライアント切断等で待機がキャンセルされた場合
+      if waiter.future.done() and not waiter.future.cancelled():
+        self._release(waiter)
+      elif waiter in state.queues[job_class]:
+        state.queues[job_class].remove(waiter)
+      raise
+
+    try:
+      yield job_class
+    finally:
+      self._release(waiter)
+
+  def stats(self) -> Dict[str, Any]:
+    """テナントごとのキュー長・待ち時間などの統計"""
+    self._evict_idle_tenants()
+    tenants = {}
+    for tenant, state in self.tenants.items():
+      started = state.completed + state.running
+      tenants[tenant] = {
+        "weight": state.weight,
+        "queued": {job_class: len(state.queues[job_class]) for job_class in JOB_CLASSES},
+        "running": state.running,
+        "completed": state.completed,
+        "avg_wait_ms": round(state.total_wait / started * 1000, 2) if started else 0.0,
+        "max_wait_ms": round(state.max_wait * 1000, 2)
+      }
+
+    return {
+      "slots": self.slots,
+      "batch_slots": self.batch_slots,
+      "interactive_max_tasks": self.interactive_max_tasks,
+      "max_tenants": self.max_tenants,
+      "running": dict(self.running),
+      "tenants": tenants
+    }
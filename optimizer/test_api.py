@@ -4,6 +4,7 @@ FastAPI最適化エンドポイントのテストスクリプト
 """
 
 import requests
+import msgpack
 import json
 import sys
 from typing import Dict, Any
@@ -137,6 +138,287 @@ def test_detailed_endpoint(base_url: str = "http://localhost:8000", test_file: s
     print(f"Detailed test failed: {e}")
     return False
 
+def test_compact_endpoint(base_url: str = "http://localhost:8000", test_file: str = "test_optimize.json") -> bool:
+  """コンパクト形式・MessagePack・圧縮でのエンドポイントのテスト"""
+  try:
+    # テストデータの読み込み
+    with open(test_file, 'r', encoding='utf-8') as f:
+      test_data = json.load(f)
+
+    # コンパクト形式の詳細結果を要求
+    test_data["detailed"] = True
+    test_data["max_solutions"] = 5
+    test_data["compact"] = True
+
+    # MessagePackで送信し、MessagePack + gzipで受信
+    response = requests.post(
+      f"{base_url}/optimize",
+      data=msgpack.packb(test_data),
+      headers={
+        "Content-Type": "application/msgpack",
+        "Accept": "application/msgpack",
+        "Accept-Encoding": "gzip"
+      }
+    )
+
+    print(f"Compact Optimization Endpoint: {response.status_code}")
+
+    if response.status_code == 200:
+      print(f"Content-Type: {response.headers.get('Content-Type')}")
+      print(f"Content-Encoding: {response.headers.get('Content-Encoding')}")
+
+      result = msgpack.unpackb(response.content)
+      print(f"Layout: {result['layout']}")
+      print(f"Total solutions: {result['total_solutions']}")
+      print(f"Execution time: {result['execution_time_ms']}ms")
+
+      # インデックス配列をタスク情報に展開
+      best = next(s for s in result['solutions'] if s['solution_id'] == result['best_solution_id'])
+      print(f"\nBest solution (ID: {best['solution_id']}):")
+      for position, index in enumerate(best['order']):
+        print(f"    {position + 1}. {result['tasks'][index]['title']}")
+
+      return True
+    else:
+      print(f"Error: {response.text}")
+      return False
+
+  except Exception as e:
+    print(f"Compact test failed: {e}")
+    return False
+
+def test_scheduler_stats(base_url: str = "http://localhost:8000") -> bool:
+  """スケジューラ統計エンドポイントのテスト"""
+  try:
+    response = requests.get(f"{base_url}/optimizer/scheduler/stats")
+    print(f"Scheduler Stats: {response.status_code}")
+
+    if response.status_code == 200:
+      result = response.json()
+      print(f"Slots: {result['slots']} (batch: {result['batch_slots']})")
+
+      for tenant, stats in result['tenants'].items():
+        print(f"  {tenant}: queued={stats['queued']}, running={stats['running']}, avg_wait={stats['avg_wait_ms']}ms")
+
+      return True
+    else:
+      print(f"Error: {response.text}")
+      return False
+
+  except Exception as e:
+    print(f"Scheduler stats test failed: {e}")
+    return False
+
+def test_profile_endpoint(base_url: str = "http://localhost:8000", test_file: str = "test_optimize.json") -> bool:
+  """管理者トークンによるプロファイリングのテスト（環境変数 OPTIMIZER_PROFILE_TOKEN が必要）"""
+  import os
+
+  token = os.getenv("OPTIMIZER_PROFILE_TOKEN")
+  if not token:
+    print("Profile endpoint test skipped: OPTIMIZER_PROFILE_TOKEN is not set")
+    return True
+
+  try:
+    with open(test_file, 'r', encoding='utf-8') as f:
+      test_data = json.load(f)
+
+    response = requests.post(
+      f"{base_url}/optimizer/optimize",
+      json=test_data,
+      headers={"Content-Type": "application/json", "X-Optimizer-Profile-Token": token}
+    )
+
+    print(f"Profile Endpoint: {response.status_code}")
+
+    if response.status_code == 200:
+      profile = response.json().get("profile")
+      if not profile:
+        print("Error: profile is missing")
+        return False
+      if profile.get("skipped"):
+        # 他のリクエストを計測中の場合は内訳が含まれない
+        print("Error: profiling was skipped")
+        return False
+
+      print(f"Samples: {profile['samples']}, elapsed: {profile['elapsed_ms']}ms")
+      for name, stats in profile['breakdown'].items():
+        print(f"  {name}: {stats['ratio'] * 100:.1f}%")
+
+      return bool(profile['breakdown']) and bool(profile['folded'])
+    else:
+      print(f"Error: {response.text}")
+      return False
+
+  except Exception as e:
+    print(f"Profile endpoint test failed: {e}")
+    return False
+
+def test_profile_categories(test_file: str = "test_optimize.json") -> bool:
+  """プロファイル内訳の分類が実装と一致しているかの確認（サーバー不要）"""
+  try:
+    import os
+    from fastapi.testclient import TestClient
+    import main as optimizer_main
+    import optimizer
+    from profiling import PROFILED_FUNCTIONS
+
+    # 分類に使う関数名が実装に存在するか
+    missing = []
+    for category, names in PROFILED_FUNCTIONS.items():
+      for name in names:
+        if not any(hasattr(target, name) for target in (optimizer_main, optimizer, optimizer.TaskSchedulingProblem)):
+          missing.append(f"{category}: {name}")
+
+    # プロセス内で1回プロファイルし、根のフレーム（結果構築）が分類されているか
+    with open(test_file, 'r', encoding='utf-8') as f:
+      test_data = json.load(f)
+
+    os.environ["OPTIMIZER_PROFILING"] = "enabled"
+    test_data["profile"] = True
+    response = TestClient(optimizer_main.app).post("/optimizer/optimize", json=test_data)
+    root_category = response.json()["profile"]["root_category"]
+
+    print(f"Profile categories: missing={missing}, root_category={root_category}")
+
+    return not missing and root_category == "result_building"
+
+  except Exception as e:
+    print(f"Profile categories test failed: {e}")
+    return False
+
+def test_local_search_consistency(test_file: str = "test_optimize.json") -> bool:
+  """局所探索の差分評価が TaskSchedulingProblem の評価と一致しているかの確認（サーバー不要）"""
+  try:
+    import random
+    import numpy as np
+    from optimizer import TaskSchedulingProblem
+    from local_search import IncrementalEvaluator
+
+    with open(test_file, 'r', encoding='utf-8') as f:
+      test_data = json.load(f)
+
+    problem = TaskSchedulingProblem(test_data["tasks"], test_data.get("weights"))
+    # 評価の間に現在時刻が進むと締切違反がずれるため、開始時刻を固定する
+    start_time = problem.schedule_start()
+    problem.schedule_start = lambda: start_time
+    evaluator = IncrementalEvaluator(problem)
+
+    rng = random.Random(0)
+    n = len(problem.tasks)
+    max_error = 0.0
+    for _ in range(100):
+      order = list(range(n))
+      rng.shuffle(order)
+
+      # 全体評価: evaluate_order は (-優先度, -効率性, 制約違反)
+      objectives = problem.evaluate_order(np.array(order))
+      expected = (-objectives[0], -objectives[1], objectives[2])
+      actual = evaluator.evaluate(order)
+      max_error = max(max_error, *(abs(a - e) for a, e in zip(actual, expected)))
+
+      # 差分評価: 区間を反転した順列との全体評価の差
+      lo = rng.randrange(n - 1)
+      hi = rng.randrange(lo + 1, n)
+      new_segment = order[lo:hi + 1][::-1]
+      new_order = order[:lo] + new_segment + order[hi + 1:]
+      start_hours = sum(evaluator.duration_hours[index] for index in order[:lo])
+      delta = evaluator.segment_delta(order[lo:hi + 1], new_segment, lo, start_hours)
+      new_values = evaluator.evaluate(new_order)
+      max_error = max(max_error, *(abs(d - (b - a)) for d, a, b in zip(delta, actual, new_values)))
+
+    print(f"Local search consistency: max_error={max_error:.3e}")
+
+    return max_error < 1e-9
+
+  except Exception as e:
+    print(f"Local search consistency test failed: {e}")
+    return False
+
+def test_fair_scheduler() -> bool:
+  """FairScheduler のディスパッチ順・スロット制限・キャンセル処理の確認（サーバー不要）"""
+  try:
+    import asyncio
+    from scheduler import FairScheduler, INTERACTIVE, BATCH
+
+    async def hold(scheduler, tenant, n_tasks, order, release):
+      async with scheduler.slot(tenant, n_tasks):
+        order.append(tenant)
+        await release.wait()
+
+    async def dispatch_order(scheduler, jobs):
+      """先行ジョブがスロットを保持している間に jobs を投入し、実行された順を返す"""
+      order = []
+      holder_release = asyncio.Event()
+      released = asyncio.Event()
+      released.set()
+      holder = asyncio.create_task(hold(scheduler, "holder", 1, [], holder_release))
+      await asyncio.sleep(0)
+      waiting = [asyncio.create_task(hold(scheduler, tenant, n_tasks, order, released)) for tenant, n_tasks in jobs]
+      await asyncio.sleep(0)
+      holder_release.set()
+      await asyncio.gather(holder, *waiting)
+      return order
+
+    checks = {}
+
+    # interactive クラスが batch クラスより先に実行される
+    order = asyncio.run(dispatch_order(FairScheduler(slots=1, interactive_max_tasks=10), [("batch", 100), ("interactive", 5)]))
+    checks["interactive_first"] = order == ["interactive", "batch"]
+
+    # 重み2のテナントは重み1のテナントの2倍の頻度で実行される（仮想開始時刻の順）
+    jobs = [(tenant, 5) for _ in range(4) for tenant in ("a", "b")]
+    order = asyncio.run(dispatch_order(FairScheduler(slots=1, tenant_weights={"a": 2.0}), jobs))
+    checks["weighted_order"] = order == ["a", "b", "a", "a", "b", "a", "b", "b"]
+
+    # batch クラスの同時実行数は batch_slots まで
+    async def batch_cap():
+      scheduler = FairScheduler(slots=3, interactive_max_tasks=10)
+      release = asyncio.Event()
+      running = [asyncio.create_task(hold(scheduler, f"batch-{i}", 100, [], release)) for i in range(3)]
+      await asyncio.sleep(0)
+      batch_running = scheduler.running[BATCH]
+      running.append(asyncio.create_task(hold(scheduler, "interactive", 5, [], release)))
+      await asyncio.sleep(0)
+      interactive_running = scheduler.running[INTERACTIVE]
+      release.set()
+      await asyncio.gather(*running)
+      return scheduler.batch_slots == 2 and batch_running == 2 and interactive_running == 1
+
+    checks["batch_cap"] = asyncio.run(batch_cap())
+
+    # スロットの解放と同じループ内でキャンセルされた待機ジョブはスロットを消費しない
+    async def cancelled_waiter():
+      scheduler = FairScheduler(slots=1)
+      holder_release = asyncio.Event()
+      release = asyncio.Event()
+      release.set()
+      holder = asyncio.create_task(hold(scheduler, "holder", 1, [], holder_release))
+      await asyncio.sleep(0)
+      cancelled = asyncio.create_task(hold(scheduler, "cancelled", 1, [], release))
+      following = asyncio.create_task(hold(scheduler, "following", 1, [], release))
+      await asyncio.sleep(0)
+      holder_release.set()
+      cancelled.cancel()
+      results = await asyncio.gather(holder, cancelled, return_exceptions=True)
+      await asyncio.wait_for(following, timeout=1.0)
+      return (results[0] is None and isinstance(results[1], asyncio.CancelledError)
+              and sum(scheduler.running.values()) == 0)
+
+    checks["cancelled_waiter"] = asyncio.run(cancelled_waiter())
+
+    # interactive クラスが先に実行されても仮想時刻は戻らない
+    scheduler = FairScheduler(slots=1, interactive_max_tasks=50)
+    asyncio.run(dispatch_order(scheduler, [("heavy", 10)] * 3 + [("batch", 100)]))
+    checks["virtual_time_monotonic"] = scheduler.virtual_time == 20.0
+
+    print(f"Fair scheduler: {checks}")
+
+    return all(checks.values())
+
+  except Exception as e:
+    print(f"Fair scheduler test failed: {e!r}")
+    return False
+
 def main():
   """メイン関数"""
   base_url = "http://localhost:8000"
@@ -148,6 +430,21 @@ def main():
   print(f"Base URL: {base_url}")
   print()
 
+  # プロファイル内訳の分類チェック（サーバー不要）
+  print("0. Profile Categories Check")
+  categories_ok = test_profile_categories()
+  print()
+
+  # 局所探索の差分評価チェック（サーバー不要）
+  print("0. Local Search Consistency Check")
+  local_search_ok = test_local_search_consistency()
+  print()
+
+  # スケジューラの動作チェック（サーバー不要）
+  print("0. Fair Scheduler Check")
+  fair_scheduler_ok = test_fair_scheduler()
+  print()
+
   # ヘルスチェック
   print("1. Health Check Test")
   health_ok = test_health_check(base_url)
@@ -172,7 +469,22 @@ def main():
   detailed_ok = test_detailed_endpoint(base_url)
   print()
 
-  if optimize_ok and weights_ok and detailed_ok:
+  # コンパクト形式・MessagePackテスト
+  print("5. Compact MessagePack Optimization Test")
+  compact_ok = test_compact_endpoint(base_url)
+  print()
+
+  # スケジューラ統計テスト
+  print("6. Scheduler Stats Test")
+  scheduler_ok = test_scheduler_stats(base_url)
+  print()
+
+  # 管理者トークンによるプロファイリングテスト
+  print("7. Profile Token Test")
+  profile_ok = test_profile_endpoint(base_url)
+  print()
+
+  if categories_ok and local_search_ok and fair_scheduler_ok and optimize_ok and weights_ok and detailed_ok and compact_ok and scheduler_ok and profile_ok:
     print("✅ All tests passed!")
   else:
     print("❌ Some tests failed!")
@@ -0,0 +1,232 @@
+import gzip
+import io
+import json
+import logging
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# オプション依存（未インストールの場合はJSON・gzipのみ対応）
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# この値未満のレスポンスは圧縮しない（GZipMiddlewareのデフォルトに合わせる）
+MIN_COMPRESS_SIZE = 1000
+
+# 展開後のリクエストボディの上限（gzip/zstd共通、Podのメモリ上限256Miに対して十分小さい値）
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+def _parse_header_values(header: Optional[str]) -> Dict[str, float]:
+  """Accept系ヘッダーを {値: q値} に変換"""
+  values = {}
+  for part in (header or "").split(","):
+    token, _, params = part.strip().partition(";")
+    token = token.strip().lower()
+    if not token:
+      continue
+    q = 1.0
+    for param in params.split(";"):
+      key, _, value = param.strip().partition("=")
+      if key.strip() == "q":
+        try:
+          q = float(value)
+        except ValueError:
+          q = 0.0
+    values[token] = q
+  return values
+
+def _decompress(body: bytes, content_encoding: str) -> bytes:
+  """
+  Content-Encoding に従ってリクエストボディを展開
+
+  展開後のサイズが MAX_DECOMPRESSED_SIZE を超える場合は、
+  全体を展開する前に打ち切って 413 を返す（圧縮爆弾対策）
+  """
+  encoding = content_encoding.strip().lower()
+  if encoding in ("", "identity"):
+    return body
+  if encoding not in ("gzip", "zstd") or (encoding == "zstd" and zstandard is None):
+    logger.warning(f"未対応のContent-Encodingを拒否: {content_encoding}")
+    raise HTTPException(status_code=415, detail=f"未対応のContent-Encodingです: {content_encoding}")
+
+  try:
+    if encoding == "gzip":
+      decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+      data = decompressor.decompress(body, MAX_DECOMPRESSED_SIZE + 1)
+      if len(data) <= MAX_DECOMPRESSED_SIZE and not decompressor.eof:
+        raise ValueError("gzipデータが途中で終わっています")
+    else:
+      chunks = []
+      size = 0
+      with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+        while size <= MAX_DECOMPRESSED_SIZE:
+          chunk = reader.read(MAX_DECOMPRESSED_SIZE + 1 - size)
+          if not chunk:
+            break
+          chunks.append(chunk)
+          size += len(chunk)
+      data = b"".join(chunks)
+  except Exception as e:
+    logger.warning(f"リクエストボディの展開エラー（{encoding}）: {str(e)}")
+    raise HTTPException(status_code=400, detail=f"リクエストボディの展開に失敗しました: {str(e)}")
+
+  if len(data) > MAX_DECOMPRESSED_SIZE:
+    logger.warning(f"展開後のリクエストボディが上限を超えたため拒否（{encoding}, 圧縮時 {len(body)}バイト）")
+    raise HTTPException(status_code=413, detail=f"展開後のリクエストボディが上限（{MAX_DECOMPRESSED_SIZE}バイト）を超えています")
+  return data
+
+class WireFormatRequest(Request):
+  """
+  MessagePack・圧縮ボディに対応したリクエスト
+
+  - Content-Encoding: gzip / zstd のボディを展開
+  - Content-Type: application/msgpack のボディをデコード
+  """
+
+  async def body(self) -> bytes:
+    if not hasattr(self, "_body"):
+      body = await super().body()
+      self._body = _decompress(body, self.scope.get("wire_content_encoding", ""))
+    return self._body
+
+  async def json(self) -> Any:
+    if not hasattr(self, "_json"):
+      body = await self.body()
+      if self.scope.get("wire_format") == "msgpack":
+        try:
+          self._json = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+          logger.warning(f"MessagePackのデコードエラー: {str(e)}")
+          raise HTTPException(status_code=400, detail=f"MessagePackのデコードに失敗しました: {str(e)}")
+      else:
+        self._json = json.loads(body)
+    return self._json
+
+class WireFormatRoute(APIRoute):
+  """
+  MessagePack・圧縮リクエストを受け付けるルート
+
+  FastAPIはJSON以外のContent-Typeをボディとして解析しないため、
+  MessagePackの場合は Content-Type をJSONとして扱わせ、
+  デコード自体は WireFormatRequest.json() で行う
+  """
+
+  def get_route_handler(self) -> Callable:
+    original_route_handler = super().get_route_handler()
+
+    async def wire_format_route_handler(request: Request) -> Response:
+      scope = request.scope
+      headers = []
+      for key, value in scope["headers"]:
+        if key == b"content-encoding":
+          # 展開後のボディを扱うため、ヘッダーはscopeに退避する
+          scope["wire_content_encoding"] = value.decode("latin-1")
+          continue
+        if key == b"content-type" and value.decode("latin-1").split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES:
+          if msgpack is None:
+            logger.warning("msgpack 未インストールのため MessagePack リクエストを拒否")
+            raise HTTPException(status_code=415, detail="MessagePackはこのサーバーで無効です")
+          scope["wire_format"] = "msgpack"
+          value = JSON_MEDIA_TYPE.encode("latin-1")
+        headers.append((key, value))
+      scope["headers"] = headers
+
+      return await original_route_handler(WireFormatRequest(scope, request.receive))
+
+    return wire_format_route_handler
+
+def encode_response(content: Any, request: Request, status_code: int = 200) -> Response:
+  """
+  Accept / Accept-Encoding に従ってレスポンスをエンコード
+
+  Args:
+    content: JSONシリアライズ可能なレスポンス内容
+    request: リクエスト（ヘッダーの参照用）
+    status_code: HTTPステータスコード
+
+  Returns:
+    MessagePackまたはJSON（必要に応じてgzip/zstd圧縮）のレスポンス
+  """
+  accept = _parse_header_values(request.headers.get("accept"))
+  accept_encoding = _parse_header_values(request.headers.get("accept-encoding"))
+
+  # メディアタイプの決定（MessagePackが明示的に要求された場合のみ）
+  media_type = JSON_MEDIA_TYPE
+  if msgpack is not None:
+    for msgpack_type in MSGPACK_MEDIA_TYPES:
+      if accept.get(msgpack_type, 0.0) > 0 and accept.get(msgpack_type, 0.0) >= accept.get(JSON_MEDIA_TYPE, 0.0):
+        media_type = msgpack_type
+        break
+
+  if media_type == JSON_MEDIA_TYPE:
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+  else:
+    body = msgpack.packb(content, use_bin_type=True)
+
+  headers = {"Vary": "Accept, Accept-Encoding"}
+
+  # 圧縮方式の決定（zstd > gzip）
+  if len(body) >= MIN_COMPRESS_SIZE:
+    if zstandard is not None and accept_encoding.get("zstd", 0.0) > 0:
+      body = zstandard.ZstdCompressor().compress(body)
+      headers["Content-Encoding"] = "zstd"
+    elif accept_encoding.get("gzip", 0.0) > 0:
+      body = gzip.compress(body, compresslevel=6)
+      headers["Content-Encoding"] = "gzip"
+
+  return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+def build_compact_result(nsga2_result: Dict[str, Any], tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+  """
+  詳細結果をコンパクト形式に変換
+
+  タスク情報は "tasks" に1回だけ含め、各解の順序は "tasks" への
+  インデックス配列 "order" で表す（解の数 × タスク数でサイズが増えない）
+
+  Args:
+    nsga2_result: run_nsga2_optimization の結果
+    tasks: リクエストのタスクリスト（辞書形式）
+
+  Returns:
+    コンパクト形式の詳細結果
+  """
+  task_id_to_index = {task["id"]: i for i, task in enumerate(tasks)}
+
+  solutions = [
+    {
+      "solution_id": solution["solution_id"],
+      "order": [task_id_to_index[task_info["id"]] for task_info in solution["task_order"]],
+      "objectives": solution["objectives"],
+      "metrics": solution["metrics"]
+    }
+    for solution in nsga2_result["solutions"]
+  ]
+
+  best_solution = nsga2_result["best_solution"]
+
+  return {
+    "layout": "compact",
+    "algorithm": nsga2_result["algorithm"],
+    "parameters": nsga2_result["parameters"],
+    "tasks": tasks,
+    "solutions": solutions,
+    "total_solutions": nsga2_result["total_solutions"],
+    "best_solution_id": best_solution["solution_id"] if best_solution else None,
+    "execution_time_ms": nsga2_result.get("execution_time_ms")
+  }